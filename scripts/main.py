@@ -1,21 +1,20 @@
 #!/usr/bin/env python
 
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List
 import typer
 from pathlib import Path
 from shutil import rmtree
 
-from runner.logger import LOG
-from runner.cases import parse_cases_file, run_test_case
-from runner.results import ResultEntry, TestResults
-from runner.utils import (
-    CompilationProvider,
+from runner.options import (
+    TEMP_DIR,
     OptimisationLevel,
-    compile_and_copy,
-    to_entry,
+    OutputKind,
+    REPO_DIR,
+    OutputSettings,
+    Settings,
 )
-from runner.options import TEMP_DIR, OutputKind, REPO_DIR, OutputSettings, Settings
-from runner.output import TabulatedOutput
 
 
 app = typer.Typer(add_completion=False)
@@ -27,6 +26,8 @@ def clear():
     Remove any artifacts that were generated by previous runs.
     """
 
+    from runner.logger import LOG
+
     if TEMP_DIR.exists():
         LOG.info("clearing entries")
         rmtree(TEMP_DIR)
@@ -57,6 +58,17 @@ def compare(
         OptimisationLevel.release,
         help="The optimisation level the compiler should be compiled to",
     ),
+    jobs: int = typer.Option(
+        1,
+        help="The maximum number of compiler invocations to run concurrently, more jobs "
+        "are faster but the runs compete for the machine which skews their metrics",
+        min=1,
+    ),
+    parallel_iterations: bool = typer.Option(
+        False,
+        help="Run the measured iterations of each case concurrently, this is faster "
+        "but the runs compete for the machine which skews their metrics",
+    ),
 ):
     """
     Perform a run between two or more versions of the compiler.
@@ -72,25 +84,48 @@ def compare(
     format of the metrics can be configured through the commandline arguments.
     """
 
+    # The runner modules pull in `pydantic`, `numpy` and `structlog`, they are only
+    # imported once a comparison is actually run so that the rest of the CLI starts quickly.
+    from runner.logger import LOG
+    from runner.cases import (
+        TestCase,
+        TestCaseResult,
+        parse_cases_file,
+        run_key,
+        run_test_case,
+    )
+    from runner.build import GitSession
+    from runner.results import ResultEntry
+    from runner.utils import CompilationProvider, compile_all, to_entry
+    from runner.output import JsonOutput, TabulatedOutput
+
     # Check whether the repository path exists or not.
     repo = Path(repository)
     if not repo.exists() or not repo.is_dir():
         raise typer.BadParameter("The repository does not exist or is not a directory")
 
     settings = Settings(
-        repository=repo, optimisation_level=optimisation_level, output_kind=output
+        repository=repo,
+        optimisation_level=optimisation_level,
+        output_kind=output,
+        jobs=jobs,
+        parallel_iterations=parallel_iterations,
     )
 
-    # determine whether the left and right is an executable.
+    # determine whether the left and right is an executable. Any revisions are all
+    # looked up by a single `git` process.
     left, right = left.strip(), right.strip()
-    left_entry = to_entry(settings, name="left", path_or_revision=left)
+
+    with GitSession(repo) as git:
+        left_entry = to_entry(settings, git, name="left", path_or_revision=left)
+        right_entry = to_entry(settings, git, name="right", path_or_revision=right)
+
     if left_entry is None:
         raise typer.BadParameter(
             "The left comparison object is not a valid path to an executable or "
             "a revision number"
         )
 
-    right_entry = to_entry(settings, name="right", path_or_revision=right)
     if right_entry is None:
         raise typer.BadParameter(
             "The left comparison object is not a valid path to an executable or "
@@ -106,10 +141,12 @@ def compare(
 
     compilation_providers: List[CompilationProvider] = []
 
-    for entry in [left_entry, right_entry]:
-        # now we need to either copy over the executable into the "testbed", or checkout
-        # the revision, compile it and then copy over the executable.
-        compilation_result = compile_and_copy(settings, entry)
+    # now we need to either copy over the executable into the "testbed", or prepare a
+    # worktree of the revision, compile it and then copy over the executable.
+    entries = [left_entry, right_entry]
+    compilation_results = compile_all(settings, entries)
+
+    for entry, compilation_result in zip(entries, compilation_results):
         if compilation_result is None:
             raise typer.BadParameter(
                 f"Failed to compile and copy the `{entry.name}` comparison object"
@@ -118,47 +155,85 @@ def compare(
             compilation_providers.append(compilation_result)
 
     test_config = parse_cases_file(cases_path)
-    results = []
-
-    for case_id, case in enumerate(test_config.cases):
-        # get the left and right results
-        left_result = run_test_case(
-            repo=repo, compiler=compilation_providers[0], case=case, case_id=case_id
-        )
-        right_result = run_test_case(
-            repo=repo, compiler=compilation_providers[1], case=case, case_id=case_id
-        )
-
-        if left_result.exit_code != 0:
-            LOG.error(f"failed to run the left comparison object on case `{case.file}`")
-            continue
-
-        if right_result.exit_code != 0:
-            LOG.error(
-                f"failed to run the right comparison object on case `{case.file}`"
-            )
-            continue
-
-        # construct the results from both runs
-        results.append(
-            ResultEntry(name=case.name, original=left_result, result=right_result)
-        )
-
-    test_results = TestResults(case_results=results)
 
-    # now we want to output the results in the desired format.
+    # The results are handed to the output as soon as each case has been run, the
+    # output decides whether it can write them out straight away.
     #
     # TODO: add ways to configure this
     output_settings = OutputSettings()
 
     match settings.output_kind:
         case OutputKind.table:
-            result_printer = TabulatedOutput(
-                output_settings, test_results, compilation_providers
-            )
-            result_printer.print_info()
+            result_printer = TabulatedOutput(output_settings, compilation_providers)
         case OutputKind.json:
-            print(results.model_dump_json())
+            result_printer = JsonOutput()
+
+    # Each case is run against both of the compilers concurrently. The compiler invocations
+    # themselves are throttled by the `run_executor`, the `case_executor` only waits on them.
+    #
+    # Runs are keyed by their contents, so when both compilers are the same executable, or
+    # the same case appears more than once, each distinct run only happens once.
+    scheduled: Dict[str, Future[TestCaseResult]] = {}
+
+    with (
+        ThreadPoolExecutor(max_workers=settings.jobs) as run_executor,
+        ThreadPoolExecutor(max_workers=settings.jobs) as case_executor,
+    ):
+        run_case = partial(
+            run_test_case,
+            repo=repo,
+            executor=run_executor,
+            parallel_iterations=settings.parallel_iterations,
+        )
+
+        def schedule(compiler: CompilationProvider, case_id: int, case: TestCase):
+            key = run_key(repo, compiler, case)
+
+            if key not in scheduled:
+                scheduled[key] = case_executor.submit(
+                    run_case, compiler=compiler, case=case, case_id=case_id
+                )
+
+            return scheduled[key]
+
+        pending = [
+            (
+                case_id,
+                case,
+                [
+                    schedule(compiler, case_id, case)
+                    for compiler in compilation_providers
+                ],
+            )
+            for case_id, case in enumerate(test_config.cases)
+        ]
+
+        for case_id, case, futures in pending:
+            # A shared run may have been scheduled by another case, so its result is
+            # re-labelled with this case.
+            left_result, right_result = (
+                future.result().model_copy(update={"case": case_id})
+                for future in futures
+            )
+
+            if left_result.exit_code != 0:
+                LOG.error(
+                    f"failed to run the left comparison object on case `{case.file}`"
+                )
+                continue
+
+            if right_result.exit_code != 0:
+                LOG.error(
+                    f"failed to run the right comparison object on case `{case.file}`"
+                )
+                continue
+
+            # construct the results from both runs
+            result_printer.append(
+                ResultEntry(name=case.name, original=left_result, result=right_result)
+            )
+
+    result_printer.finish()
 
 
 def main():
@@ -1,9 +1,323 @@
-import subprocess
+import os
+import shutil
+import threading
+from subprocess import DEVNULL, PIPE, Popen
 from pathlib import Path
+from typing import Dict, Optional, Self
 
+import orjson
 
-def checkout_git_revision(repo: Path, revision: str):
-    result = subprocess.Popen(["git", "checkout", revision], cwd=repo).wait()
+from .logger import LOG
+from .options import TEMP_DIR
 
-    if result != 0:
-        raise RuntimeError(f"Could not checkout {revision=}")
+WORKTREE_DIR = TEMP_DIR / "worktrees"
+
+# The number of worktrees that are kept around for later runs, each of them holds a full
+# build of the compiler.
+MAX_WORKTREES = 4
+
+
+def _run_git(repo: Path, *args: str) -> str:
+    """
+    Run a git command within the given repository and return its output.
+
+    :param repo: Path to the repository to run the command in.
+    :param args: The arguments to pass to `git`.
+    :return: The standard output of the command.
+    """
+    handle = Popen(["git", *args], cwd=repo, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = handle.communicate()
+
+    if handle.returncode != 0:
+        LOG.error(f"`git {' '.join(args)}` failed, error:\n{stderr.decode()}")
+        raise RuntimeError(f"Could not run `git {args[0]}` in {repo=}")
+
+    return stdout.decode().strip()
+
+
+class GitSession:
+    """
+    A long-lived `git cat-file --batch-check` process of a repository, which answers
+    queries about the objects of the repository without spawning a `git` process for
+    each of them.
+
+    The process is only started once it is first needed, and it is stopped when the
+    session is closed. Queries may be made from several threads.
+    """
+
+    repo: Path
+
+    def __init__(self, repo: Path):
+        self.repo = repo
+        self._handle: Optional[Popen[str]] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def revision_exists(self, revision: str) -> bool:
+        """
+        Check if the given revision exists within the repository.
+
+        :param revision: The revision identifier.
+        :return: True if exists, False otherwise.
+        """
+
+        # The revisions are passed one per line, so one that spans lines cannot exist.
+        if not revision or "\n" in revision:
+            return False
+
+        with self._lock:
+            if self._handle is None:
+                self._handle = Popen(
+                    ["git", "cat-file", "--batch-check"],
+                    cwd=self.repo,
+                    stdin=PIPE,
+                    stdout=PIPE,
+                    stderr=DEVNULL,
+                    text=True,
+                )
+
+            assert self._handle.stdin and self._handle.stdout
+
+            try:
+                self._handle.stdin.write(f"{revision}\n")
+                self._handle.stdin.flush()
+                line = self._handle.stdout.readline()
+            except BrokenPipeError:
+                # `git` exited straight away, e.g. this isn't a repository.
+                return False
+
+        # Revisions that don't name a single object are echoed back, followed by the
+        # reason, otherwise the line starts with the hash of the object.
+        return line != "" and not line.endswith((" missing\n", " ambiguous\n"))
+
+    def close(self) -> None:
+        """
+        Stop the `git` process of the session, if it was started.
+        """
+        with self._lock:
+            if self._handle is None:
+                return
+
+            assert self._handle.stdin
+            self._handle.stdin.close()
+            self._handle.wait()
+            self._handle = None
+
+
+def resolve_revision(repo: Path, revision: str) -> str:
+    """
+    Resolve the given revision into the hash of the commit that it points to.
+
+    :param repo: Path to the repository.
+    :param revision: The revision identifier.
+    :return: The full commit hash.
+    """
+    return _run_git(repo, "rev-parse", "--verify", f"{revision}^{{commit}}")
+
+
+# The locks of the worktrees, keyed by the commit that they are checked out at.
+_WORKTREE_LOCKS: Dict[str, threading.RLock] = {}
+_WORKTREE_LOCKS_GUARD = threading.Lock()
+
+# Serialises the changes to the records of the worktrees that are kept by `git`.
+_WORKTREE_GIT_LOCK = threading.Lock()
+
+
+def worktree_lock(commit: str) -> threading.RLock:
+    """
+    The lock of the worktree of the given commit. Anything that creates, removes, or
+    builds within the worktree must hold it, since several entries can resolve to the
+    same commit. The lock is re-entrant, so it can be held around `prepare_worktree`.
+
+    :param commit: The full hash of the commit of the worktree.
+    :return: The lock of the worktree.
+    """
+    with _WORKTREE_LOCKS_GUARD:
+        return _WORKTREE_LOCKS.setdefault(commit, threading.RLock())
+
+
+def prepare_worktree(repo: Path, commit: str) -> Path:
+    """
+    Create a git worktree of the repository that is checked out at the given
+    commit, so that several revisions can be built side by side without
+    touching the working tree of the repository itself.
+
+    Worktrees are keyed by the commit hash and re-used across runs, the commit
+    is recorded next to the worktree once it is fully set up, so re-using a
+    worktree costs a single file read. A new worktree starts with an empty
+    `target/` directory, the compiled dependencies are shared between all of
+    the worktrees through `sccache` instead (see `build_env`). Only the
+    `MAX_WORKTREES` most recently used worktrees are kept.
+
+    The caller must hold the `worktree_lock` of the commit for as long as it
+    uses the worktree, so that it is never set up, built in, or removed by two
+    threads at once.
+
+    :param repo: Path to the repository to create the worktree of.
+    :param commit: The full hash of the commit to checkout, as returned by
+        `resolve_revision`.
+    :return: The path to the worktree.
+    """
+    root = WORKTREE_DIR / commit
+    worktree = root / "worktree"
+    current_commit = root / "current_commit"
+
+    # The worktree is only ever set up, or cleaned up, by one thread at a time.
+    with worktree_lock(commit):
+        if current_commit.is_file() and current_commit.read_text() == commit:
+            # Mark the worktree as recently used, so that it isn't pruned.
+            current_commit.touch()
+            return worktree
+
+        # A previous run was interrupted whilst setting up the worktree, start over.
+        # Nothing else can be using it, since it is only used once it is set up.
+        if root.exists():
+            shutil.rmtree(root)
+
+        # The worktrees of different commits can be set up concurrently, but `git`
+        # doesn't expect its records of the worktrees to be changed concurrently.
+        with _WORKTREE_GIT_LOCK:
+            # Drop the records of any worktrees whose directories were removed, e.g.
+            # by `clear`.
+            _run_git(repo, "worktree", "prune")
+            _run_git(repo, "worktree", "add", "--detach", str(worktree), commit)
+
+        LOG.info(f"created worktree for `{commit}` at `{worktree}`")
+
+        current_commit.write_text(commit)
+
+    _prune_worktrees(repo, keep=commit)
+    return worktree
+
+
+def _last_used(root: Path) -> int:
+    """
+    When the worktree at `root` was last used, worktrees that were never fully set up
+    are the least recently used.
+    """
+    try:
+        return (root / "current_commit").stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _prune_worktrees(repo: Path, keep: str):
+    """
+    Remove the least recently used worktrees, so that at most `MAX_WORKTREES` are left.
+    The worktree of the `keep` commit is never removed, and neither is any worktree that
+    is being used by another thread.
+
+    The executables are linked or copied out of the worktrees before they are run, so
+    removing a worktree never affects a comparison that is already running.
+    """
+    roots = sorted(
+        (root for root in WORKTREE_DIR.iterdir() if root.is_dir()),
+        key=_last_used,
+        reverse=True,
+    )
+
+    removed = False
+
+    for root in roots[MAX_WORKTREES:]:
+        lock = worktree_lock(root.name)
+
+        if root.name == keep or not lock.acquire(blocking=False):
+            continue
+
+        try:
+            # Another thread may have already removed it.
+            if not root.exists():
+                continue
+
+            shutil.rmtree(root)
+            removed = True
+        finally:
+            lock.release()
+
+        LOG.info(f"removed the unused worktree of `{root.name}`")
+
+    if removed:
+        with _WORKTREE_GIT_LOCK:
+            _run_git(repo, "worktree", "prune")
+
+
+def _build_record(worktree: Path, profile: str) -> Path:
+    """
+    The path of the record of the executable built in the worktree with the given profile.
+    """
+    return worktree.parent / f"compiler_binary.{profile}.json"
+
+
+def find_cached_build(worktree: Path, profile: str) -> Optional[Path]:
+    """
+    Find the compiler executable that was previously built in the worktree
+    with the given profile. The executable is only re-used if it was not
+    modified since it was recorded.
+
+    :param worktree: Path to the worktree, as returned by `prepare_worktree`.
+    :param profile: The cargo profile that the executable was built with.
+    :return: The path to the executable if there is a usable one, else nothing.
+    """
+    try:
+        record = orjson.loads(_build_record(worktree, profile).read_bytes())
+        path = Path(record["path"])
+
+        if path.stat().st_mtime_ns == record["mtime_ns"]:
+            return path
+    except (FileNotFoundError, KeyError, orjson.JSONDecodeError):
+        pass
+
+    return None
+
+
+def record_build(worktree: Path, profile: str, path: Path):
+    """
+    Record the compiler executable that was built in the worktree with the
+    given profile, so that later runs can skip building it.
+
+    :param worktree: Path to the worktree, as returned by `prepare_worktree`.
+    :param profile: The cargo profile that the executable was built with.
+    :param path: Path to the produced executable.
+    :return: Nothing.
+    """
+    record = {"path": str(path), "mtime_ns": path.stat().st_mtime_ns}
+    _build_record(worktree, profile).write_bytes(orjson.dumps(record))
+
+
+def shared_cache_dir(repo: Path) -> Path:
+    """
+    Compute the directory for build caches that are shared by all of the
+    worktrees of the repository. This lives in the common git directory, so
+    it is the same for every worktree and is never part of a checkout.
+
+    :param repo: Path to the repository, or any of its worktrees.
+    :return: The path to the shared cache directory.
+    """
+    common_dir = Path(_run_git(repo, "rev-parse", "--git-common-dir"))
+    return (repo / common_dir).resolve() / "metrics-cache"
+
+
+def build_env(repo: Path) -> Dict[str, str]:
+    """
+    Compute the environment to build the compiler with. When `sccache` is
+    available, `rustc` is wrapped with it and the cache is placed in the
+    shared cache directory. `sccache` is content-addressed, so concurrent
+    builds from several worktrees can safely share it.
+
+    Any of the variables that are already set by the user are respected.
+
+    :param repo: Path to the repository.
+    :return: The environment to pass to `cargo`.
+    """
+    env = dict(os.environ)
+
+    if "RUSTC_WRAPPER" not in env and shutil.which("sccache") is not None:
+        env["RUSTC_WRAPPER"] = "sccache"
+        env.setdefault("SCCACHE_DIR", str(shared_cache_dir(repo) / "sccache"))
+
+    return env
@@ -1,15 +1,24 @@
 import os
 import json
+import mmap
+import hashlib
+import shlex
+import stat
+import signal
+import platform
 import functools
 
+from concurrent.futures import Executor, as_completed
 from pathlib import Path
 from subprocess import PIPE, Popen, TimeoutExpired
-from pydantic import BaseModel, Field, ValidationError
-from typing import List, Optional
+from threading import Thread
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from typing import IO, Any, Callable, Dict, List, Optional
 
 import numpy as np
+import orjson
 
-from .stats import check_outliers
+from .stats import check_outliers_tensor
 
 
 from .messages import (
@@ -20,7 +29,7 @@ from .messages import (
     StageMetrics,
     find_message_in_stream,
 )
-from .logger import LOG
+from .logger import LOG, BoundLogger
 from .options import TEMP_DIR
 from .utils import CompilationProvider
 
@@ -30,6 +39,10 @@ class TestCase(BaseModel):
     A test case describing it and information about how to run the case.
     """
 
+    # Cases are never modified once they're loaded, and any unknown keys in the cases
+    # file are ignored.
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     """
     The name of the case, used for display and identification
     purposes.
@@ -46,7 +59,9 @@ class TestCase(BaseModel):
         description="An optional description of the case, this is used for debugging purposes.",
     )
 
-    tags: List[str] = Field([], description="Any associated tags with the case.")
+    tags: List[str] = Field(
+        default_factory=list, description="Any associated tags with the case."
+    )
 
     additional_args: Optional[str] = Field(
         None,
@@ -68,18 +83,36 @@ class TestCase(BaseModel):
     )
 
 
+# The columns of the `total` metrics of a stage that are collected across runs,
+# durations are in milliseconds.
+METRIC_COLUMNS = ("start_rss", "end_rss", "duration")
+DURATION_COLUMN = METRIC_COLUMNS.index("duration")
+
+
 class TestCaseFile(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     cases: List[TestCase]
 
 
+# The validator for the cases file is built once at import, and then shared by every load.
+_CASES_ADAPTER = TypeAdapter(TestCaseFile)
+
+
 def parse_cases_file(file: Path) -> TestCaseFile:
     """
-    Load the test cases from the provided file which is JSON.
+    Load the test cases from the provided file which is JSON. The file is memory
+    mapped and parsed straight from its bytes.
     """
-    with open(file, "r") as f:
+    with open(file, "rb") as f:
         try:
-            return TestCaseFile.model_validate_json(f.read())
-        except ValidationError as e:
+            with (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+                memoryview(mm) as data,
+            ):
+                return _CASES_ADAPTER.validate_python(orjson.loads(data))
+        # An empty file can't be mapped, and JSON errors are also `ValueError`s.
+        except (ValidationError, ValueError) as e:
             raise ValueError(
                 f"Failed to load the test cases from `{
                     file}`: {e}"
@@ -87,6 +120,8 @@ def parse_cases_file(file: Path) -> TestCaseFile:
 
 
 class TestCaseResult(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     """
     An identifier to the original case.
     """
@@ -112,47 +147,110 @@ class TestCaseResult(BaseModel):
     exe_size: Optional[int]
 
 
+# The fields of a case that affect how it is run, the rest are only used for display.
+_RUN_FIELDS = {
+    "file",
+    "additional_args",
+    "run",
+    "iterations",
+    "warmup_iterations",
+    "timeout",
+}
+
+
+def run_key(repo: Path, compiler: CompilationProvider, case: TestCase) -> str:
+    """
+    Compute a key for running the case with the compiler from their contents, that is the
+    compiler executable, the source of the case, and the options that it is run with.
+    Runs with the same key are the same, so only one of them needs to happen.
+    """
+    key = hashlib.blake2b(compiler.digest)
+    key.update(case.model_dump_json(include=_RUN_FIELDS).encode())
+
+    # If the file can't be read, the runs will fail regardless, so the path is enough.
+    try:
+        key.update((repo / case.file).read_bytes())
+    except OSError:
+        pass
+
+    return key.hexdigest()
+
+
 def run_test_case(
-    *, repo: Path, compiler: CompilationProvider, case_id: int, case: TestCase
+    *,
+    repo: Path,
+    compiler: CompilationProvider,
+    case_id: int,
+    case: TestCase,
+    executor: Executor,
+    parallel_iterations: bool = False,
 ) -> TestCaseResult:
     """
     Handle the running of a single test case. This will do the following:
 
-    - Run the warmup iterations first, the number of iterations are specified
-      by the `warmup_iterations` field in the case.
+    - Run the warmup iterations one after the other, the number of iterations are
+      specified by the `warmup_iterations` field in the case.
 
     - Run the actual iterations, the number of iterations are specified by the
-      `iterations` field in the case.
+      `iterations` field in the case. They are run one after the other, unless
+      `parallel_iterations` is set, since concurrent runs compete for the machine and
+      skew each other's metrics. Each run is an independent compiler invocation with
+      its own output directory.
 
     - Check for any outliers in the `total` metrics and warn the user if any are found.
 
-    - Return the average of the results.
+    - Return the fastest of the results per stage. The minimum is used rather than the
+      average since it is far less sensitive to noise from the rest of the system, any
+      noise only ever makes a run slower.
+
+    All of the runs are dispatched onto the provided `executor`.
+
+    References:
+    - <https://arxiv.org/abs/1608.04295>
     """
 
-    # Run the warmup iterations first.
-    LOG.info(
+    # All of the messages about the case are logged with the case attached, the logger
+    # is bound once here and shared by all of the runs.
+    log = LOG.bind(case=case.name)
+
+    log.info(
         f"compiling case `{case.file} with {case.warmup_iterations} warmup iterations`"
     )
 
-    for _ in range(case.warmup_iterations):
-        _single_run(
-            repo=repo, compiler=compiler, case_id=case_id, case=case, silent=True
-        )
-
-    # Now run the actual iterations.
-
-    results: List[TestCaseResult] = []
+    # The warmup iterations are run one after the other, since they are there to prime
+    # the caches of the machine before the measured runs. The results are discarded.
+    for run_id in range(case.warmup_iterations):
+        executor.submit(
+            _single_run,
+            repo=repo,
+            compiler=compiler,
+            case_id=case_id,
+            case=case,
+            run_id=run_id,
+            log=log,
+            silent=True,
+        ).result()
+
+    run = functools.partial(
+        _single_run,
+        repo=repo,
+        compiler=compiler,
+        case_id=case_id,
+        case=case,
+        log=log,
+    )
+    run_ids = range(case.warmup_iterations, case.warmup_iterations + case.iterations)
 
-    for i in range(case.iterations):
-        LOG.info(f"running iteration {i} for case `{case.file}`")
-        results.append(
-            _single_run(repo=repo, compiler=compiler, case_id=case_id, case=case)
-        )
+    if parallel_iterations:
+        measured_runs = [executor.submit(run, run_id=run_id) for run_id in run_ids]
+        results = [future.result() for future in as_completed(measured_runs)]
+    else:
+        results = [executor.submit(run, run_id=run_id).result() for run_id in run_ids]
 
     assert results, "no results were collected"
 
     if not any(result.compile_metrics for result in results):
-        LOG.warn("no cases exited successfully, skipping result.")
+        log.warn("no cases exited successfully, skipping result.")
         return results[0]
 
     # Find the first result that has metrics, we'll use it to combine
@@ -163,66 +261,142 @@ def run_test_case(
     )
     assert first_with_metrics is not None
 
-    LOG.info("successfully compiled and collected metrics")
+    log.info("successfully compiled and collected metrics")
+
+    # Collect the `total` entries of every stage from every run into a single
+    # `(stages, runs, columns)` tensor, stages that are missing from a run are left as
+    # `nan`. All of the reductions below are then done in one pass over the tensor.
+    stages = list(first_with_metrics.compile_metrics.metrics.keys())
+    runs = [result for result in results if result.compile_metrics is not None]
+
+    metrics_tensor = np.full((len(stages), len(runs), len(METRIC_COLUMNS)), np.nan)
+
+    for run_idx, result in enumerate(runs):
+        for stage_idx, stage in enumerate(stages):
+            entry = result.compile_metrics.metrics.get(stage)
+            if entry is None:
+                continue
+
+            metrics_tensor[stage_idx, run_idx] = (
+                entry.total.start_rss,
+                entry.total.end_rss,
+                entry.total.duration.to_ms(),
+            )
+
+    # We want to check for any statistical outliers per `total` entry in each of the
+    # metrics stages. If so, we want to warn the user about this. Outliers are only
+    # reported, they don't affect the estimate since we take the fastest run.
+    outliers = check_outliers_tensor(metrics_tensor)
+
+    for stage_idx, column_idx in zip(*np.nonzero(outliers)):
+        log.warn(
+            f"statistical outliers detected in the `{METRIC_COLUMNS[column_idx]}` "
+            f"of the `{stages[stage_idx]}` metric"
+        )
 
-    # Next we combine all of the totals per stage, into its own `total` stage.
-    combined_result = TestCaseResult(
+    # Now we want to take the entry of the fastest run of each stage, and combine them
+    # into a single result.
+    fastest_runs = np.nanargmin(metrics_tensor[:, :, DURATION_COLUMN], axis=1)
+    aggregated: Dict[str, StageMetricEntry] = {}
+
+    for stage_idx, stage in enumerate(stages):
+        start_rss, end_rss, duration = metrics_tensor[
+            stage_idx, fastest_runs[stage_idx]
+        ]
+
+        aggregated[stage] = StageMetricEntry(
+            total=MetricEntry(
+                start_rss=None if np.isnan(start_rss) else int(start_rss),
+                end_rss=None if np.isnan(end_rss) else int(end_rss),
+                duration=Duration.from_ms(float(duration)),
+            ),
+            # TODO: propagate children metrics too...
+            children=StageMetrics(metrics={}),
+        )
+
+    # Runs that failed to produce an executable have no size, so they are left out of the
+    # average rather than poisoning it.
+    exe_sizes = np.fromiter(
+        (result.exe_size for result in results if result.exe_size is not None),
+        dtype=np.int64,
+    )
+
+    return TestCaseResult(
         case=case_id,
         exit_code=0,
-        compile_metrics=Metrics(metrics={}),
-        exe_size=np.average([result.exe_size for result in results]),
+        compile_metrics=Metrics(metrics=aggregated),
+        exe_size=int(exe_sizes.mean()) if exe_sizes.size else None,
     )
 
-    for metric in first_with_metrics.compile_metrics.metrics.keys():
-        stage_metric_results: List[MetricEntry] = []
 
-        # Get all metrics of that key from all the results.
-        for result in results:
-            if result.compile_metrics is None:
-                continue
-            if metric not in result.compile_metrics.metrics:
-                continue
+@functools.lru_cache(maxsize=None)
+def _ensure_output_path(compiler_name: str, case_id: int, run_id: int) -> Path:
+    """
+    Create the output directory of a run, the directory is only created on the first
+    request for it. The directories are keyed by the case rather than by its file,
+    since several cases can be of the same file and their runs happen concurrently.
+    """
+
+    output_path = TEMP_DIR / "cases" / compiler_name / str(case_id) / str(run_id)
+    output_path.mkdir(parents=True, exist_ok=True)
+    return output_path
+
+
+class _PipeReader(Thread):
+    """
+    A thread that consumes a pipe of a running process until it is closed, the value
+    returned by `consume` is available as `result` once the thread has been joined.
+    """
+
+    stream: IO[bytes]
+    consume: Callable[[IO[bytes]], Any]
+    result: Any
+
+    def __init__(self, stream: IO[bytes], consume: Callable[[IO[bytes]], Any]):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.consume = consume
+        self.result = None
+
+    def run(self) -> None:
+        self.result = self.consume(self.stream)
 
-            stage_metric_results.append(result.compile_metrics.metrics[metric].total)
-
-        # We want to check for any statistical outliers per `total` entry in each of the
-        # metrics stages. If so, we want to warn the user about this.
-
-        if any(
-            [
-                check_outliers([entry.start_rss for entry in stage_metric_results]),
-                check_outliers([entry.end_rss for entry in stage_metric_results]),
-                check_outliers(
-                    [entry.duration.to_ms() for entry in stage_metric_results]
-                ),
-            ]
-        ):
-            LOG.warn(f"statistical outliers detected in the `{metric}` metric")
-
-        # Now we want to compute the average and the standard deviation of the results.
-        total_metric_entry = functools.reduce(lambda x, y: x + y, stage_metric_results)
-        combined_result.compile_metrics.metrics.update(
-            {
-                metric: StageMetricEntry(
-                    total=MetricEntry(
-                        start_rss=round(
-                            total_metric_entry.start_rss / len(stage_metric_results)
-                        ),
-                        end_rss=round(
-                            total_metric_entry.end_rss / len(stage_metric_results)
-                        ),
-                        duration=Duration.from_ms(
-                            total_metric_entry.duration.to_ms()
-                            / len(stage_metric_results)
-                        ),
-                    ),
-                    # TODO: propagate children metrics too...
-                    children=StageMetrics(metrics={}),
-                )
-            }
-        )
 
-    return combined_result
+def _scan_for_metrics(stream: IO[bytes]) -> Optional[Metrics]:
+    """
+    Scan the output of the compiler for the `TimingMetrics` message, and then discard
+    the rest of the output so that the compiler never blocks on a full pipe.
+    """
+
+    # we want to parse the output of the compilation as a stream of `CompilerMessage`s, where
+    # one of them will be a `TimingMetrics` message. The messages are parsed as they are
+    # produced, and we stop as soon as the `TimingMetrics` message is found.
+    #
+    # TODO: for now, we just ignore all of the other messages and try find the `TimingMetrics` message.
+    metrics = find_message_in_stream(stream, Metrics.MESSAGE_NAME)
+
+    for _ in stream:
+        pass
+
+    return metrics
+
+
+def _kill_process_tree(handle: Popen):
+    """
+    Kill the process along with any of the processes that it spawned, and wait for
+    it to exit. The process must have been started in its own session.
+    """
+
+    if platform.system() == "Windows":
+        handle.kill()
+    else:
+        try:
+            os.killpg(handle.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # everything already exited.
+            pass
+
+    handle.wait()
 
 
 def _single_run(
@@ -231,16 +405,24 @@ def _single_run(
     compiler: CompilationProvider,
     case_id: int,
     case: TestCase,
+    run_id: int,
+    log: BoundLogger = LOG,
     silent=False,
 ) -> TestCaseResult:
     """
     Run the provided test case with the compiler executable.
+
+    The `run_id` identifies the run within the case, each run writes into its own
+    output directory so that runs of the same case can happen concurrently. Any messages
+    are logged with `log`, the informational ones are skipped entirely when `silent`.
     """
 
+    if not silent:
+        log.info(f"starting run {run_id} for case `{case.file}`")
+
     # TODO: use the JSON schema from the compiler to actually validate the input args.
     file_name = case.file.stem.split(".")[0]
-    output_path = TEMP_DIR / "cases" / compiler.entry.name / file_name
-    output_path.mkdir(parents=True, exist_ok=True)
+    output_path = _ensure_output_path(compiler.entry.name, case_id, run_id)
 
     args = {
         "entry_point": str(case.file),
@@ -251,60 +433,82 @@ def _single_run(
         # "optimisation_level": "Debug" # TODO: add a way to specify this per case or per run?
     }
 
-    # Ensure that the compiler itself is executable.
-    os.chmod(compiler.path, 0o755)
+    command = [str(compiler.path), "--configure", json.dumps(args)]
+
+    with Popen(
+        command,
+        cwd=repo,
+        stderr=PIPE,
+        stdout=PIPE,
+        # The compiler is started in its own session, so that it can be killed together
+        # with any of the processes that it spawns.
+        start_new_session=True,
+    ) as handle:
+        # Both of the pipes are consumed on their own threads whilst the compiler is running,
+        # so parsing the output overlaps with the compilation, and the timeout applies to
+        # the whole run.
+        assert handle.stdout is not None and handle.stderr is not None
+
+        stdout_reader = _PipeReader(handle.stdout, _scan_for_metrics)
+        stderr_reader = _PipeReader(handle.stderr, lambda stream: stream.read())
+        stdout_reader.start()
+        stderr_reader.start()
 
-    # Args must be double encoded
-    encoded_args = json.dumps(json.dumps(args))
+        try:
+            result = handle.wait(timeout=case.timeout)
+        except TimeoutExpired:
+            log.warn(
+                f"command `{shlex.join(command)}` timed out after {case.timeout} seconds"
+            )
 
-    try:
-        handle = Popen(
-            f"{compiler.path} --configure {encoded_args}",
-            cwd=repo,
-            stderr=PIPE,
-            stdout=PIPE,
-            shell=True,
-        )
+            # Make sure that nothing is left running, otherwise it would compete with the
+            # later runs and skew their metrics. Once everything is killed the pipes are
+            # closed, and the readers finish.
+            _kill_process_tree(handle)
+            stdout_reader.join()
+            stderr_reader.join()
 
-        result = handle.wait(timeout=case.timeout)
-        stdout, stderr = handle.communicate()
-    except TimeoutExpired:
-        LOG.warn(f"command `{handle.args}` timed out after {case.timeout} seconds")
-        return TestCaseResult(
-            case=case_id, exit_code=-1, compile_metrics=None, exe_size=None
-        )
+            return TestCaseResult(
+                case=case_id, exit_code=-1, compile_metrics=None, exe_size=None
+            )
+
+        stdout_reader.join()
+        stderr_reader.join()
+
+    metrics: Optional[Metrics] = stdout_reader.result
+    stderr: bytes = stderr_reader.result
 
     # For the non-zero exit case, we simply return the result and do no further
     # processing.
     if result != 0:
-        LOG.error(
-            f"command `{handle.args}` exited with non-zero exit code, {result=}\n{stderr.decode()}"
+        log.error(
+            f"command `{shlex.join(command)}` exited with non-zero exit code, {result=}\n{stderr.decode()}"
         )
 
         return TestCaseResult(
             case=case_id, exit_code=result, compile_metrics=None, exe_size=None
         )
 
-    # we want to parse the output of the compilation as a stream of `CompilerMessage`s, where
-    # one of them will be a `TimingMetrics` message.
-    #
-    # TODO: for now, we just ignore all of the other messages and try find the `TimingMetrics` message.
-    metrics = find_message_in_stream(stdout.decode(), "metrics")
-
     if metrics is None:
-        LOG.error("failed to find the `TimingMetrics` message in the output")
+        log.error("failed to find the `TimingMetrics` message in the output")
         return TestCaseResult(
             case=case_id, exit_code=-1, compile_metrics=None, exe_size=None
         )
 
     # now we want to get the size of the produced executable. We locate the executable
-    # and get the size of it.
+    # and get the size of it, with a single `stat` of the path.
     exe_name = output_path / args.get("optimisation_level", "debug") / file_name
 
-    if not exe_name.exists() or not exe_name.is_file():
-        LOG.error(f"failed to locate the produced executable at `{exe_name}`")
-
-    size = exe_name.stat().st_size
+    try:
+        exe_stat = os.stat(exe_name)
+    except FileNotFoundError:
+        exe_stat = None
+
+    if exe_stat is None or not stat.S_ISREG(exe_stat.st_mode):
+        log.error(f"failed to locate the produced executable at `{exe_name}`")
+        size = None
+    else:
+        size = exe_stat.st_size
 
     return TestCaseResult(
         case=case_id, exit_code=result, compile_metrics=metrics, exe_size=size
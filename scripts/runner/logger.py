@@ -1,10 +1,14 @@
+import sys
+
 import structlog.stdlib
 import structlog
 
 from structlog.processors import TimeStamper, add_log_level
 
 
-# Configure structlog to remove logger name from output
+# Configure structlog to remove logger name from output. The loggers are cached once they
+# are first used, so that the configuration is only resolved once per logger. Logs are
+# written to `stderr`, so that they never mix with the results that go to `stdout`.
 structlog.configure(
     processors=[
         structlog.processors.format_exc_info,
@@ -12,7 +16,11 @@ structlog.configure(
         TimeStamper(fmt="%Y-%m-%d %H:%M:%S", utc=False),
         structlog.processors.StackInfoRenderer(),
         structlog.dev.ConsoleRenderer(colors=True),
-    ]
+    ],
+    logger_factory=structlog.PrintLoggerFactory(sys.stderr),
+    cache_logger_on_first_use=True,
 )
 
-LOG = structlog.get_logger("runner")
+type BoundLogger = structlog.typing.FilteringBoundLogger
+
+LOG: BoundLogger = structlog.get_logger("runner")
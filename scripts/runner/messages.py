@@ -1,23 +1,35 @@
-import json
+import io
+import os
+import orjson
 
-from typing import Dict, Literal, Optional, Self
-from pydantic import BaseModel, ValidationError
+from typing import ClassVar, Iterable, Literal, Optional, Self
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
 
 from .logger import LOG
 
 
+# The metrics are values which are never modified once they are created, any keys that
+# aren't known are ignored so that newer compilers can add to the messages.
+_METRICS_CONFIG = ConfigDict(frozen=True, extra="ignore")
+
+
 class Duration(BaseModel):
+    model_config = _METRICS_CONFIG
+
     secs: int
     nanos: int
 
+    # The arithmetic is only ever done on already validated models, so the
+    # results are constructed without validation.
+
     def __sub__(self, other: Self) -> Self:
-        return Duration(
+        return Duration.model_construct(
             secs=self.secs - other.secs,
             nanos=self.nanos - other.nanos,
         )
 
     def __add__(self, other: Self) -> Self:
-        return Duration(
+        return Duration.model_construct(
             secs=self.secs + other.secs,
             nanos=self.nanos + other.nanos,
         )
@@ -39,12 +51,14 @@ class Duration(BaseModel):
 
 
 class MetricEntry(BaseModel):
+    model_config = _METRICS_CONFIG
+
     start_rss: Optional[int]
     end_rss: Optional[int]
     duration: Duration
 
     def diff(self, other: Self) -> Self:
-        return MetricEntry(
+        return MetricEntry.model_construct(
             start_rss=self.start_rss - other.start_rss,
             end_rss=self.end_rss - other.end_rss,
             duration=self.duration - other.duration,
@@ -55,7 +69,7 @@ class MetricEntry(BaseModel):
         Add two MetricEntry instances together.
         """
 
-        return MetricEntry(
+        return MetricEntry.model_construct(
             start_rss=self.start_rss + other.start_rss,
             end_rss=self.end_rss + other.end_rss,
             duration=self.duration + other.duration,
@@ -63,64 +77,161 @@ class MetricEntry(BaseModel):
 
 
 class StageMetrics(BaseModel):
-    metrics: Dict[str, MetricEntry]
+    model_config = _METRICS_CONFIG
+
+    metrics: dict[str, MetricEntry]
 
     def diff(self, other: Self) -> Self:
         # TODO: account for stages that exist in one but not the other!
-        return StageMetrics(
+        other_metrics = other.metrics
+
+        return StageMetrics.model_construct(
             metrics={
-                stage: self.metrics[stage].diff(other.metrics[stage])
-                for stage in self.metrics
+                stage: entry.diff(other_metrics[stage])
+                for stage, entry in self.metrics.items()
             }
         )
 
 
 class StageMetricEntry(BaseModel):
+    model_config = _METRICS_CONFIG
+
     total: MetricEntry
     children: StageMetrics
 
     def diff(self, other: Self) -> Self:
-        return StageMetricEntry(
+        return StageMetricEntry.model_construct(
             total=self.total.diff(other.total),
             children=self.children.diff(other.children),
         )
 
 
+type MessageName = Literal["metrics"]
+
+
 # TODO: find a way to generate this from the compiler schema.
 class Metrics(BaseModel):
-    metrics: Dict[str, StageMetricEntry]
+    model_config = _METRICS_CONFIG
+
+    # The tag of the message that the metrics are sent in by the compiler.
+    MESSAGE_NAME: ClassVar[MessageName] = "metrics"
+
+    metrics: dict[str, StageMetricEntry]
 
     def add(self, other: Self) -> Self:
-        return Metrics(
+        other_metrics = other.metrics
+
+        return Metrics.model_construct(
             metrics={
-                stage: self.metrics[stage].diff(other.metrics[stage])
-                for stage in self.metrics
+                stage: entry.diff(other_metrics[stage])
+                for stage, entry in self.metrics.items()
             }
         )
 
 
-type MessageName = Literal["metrics"]
+# The validator for the metrics message is built once at import, and then shared by every
+# scan of a message stream.
+_METRICS_ADAPTER = TypeAdapter(Metrics)
+
+# The messages come from the compiler, which is trusted to produce well-formed messages, so
+# they are constructed without validation. Setting `RUNNER_STRICT=1` validates them instead.
+_STRICT = os.environ.get("RUNNER_STRICT") == "1"
+
+
+def _construct_entry(entry: dict) -> MetricEntry:
+    duration = entry["duration"]
+
+    return MetricEntry.model_construct(
+        start_rss=entry.get("start_rss"),
+        end_rss=entry.get("end_rss"),
+        duration=Duration.model_construct(
+            secs=duration["secs"], nanos=duration["nanos"]
+        ),
+    )
+
+
+def _construct_metrics(message: dict) -> Metrics:
+    """
+    Construct the `Metrics` from a parsed `metrics` message, without validating any of it.
+    A message that is missing any of the keys raises a `KeyError`.
+    """
+
+    return Metrics.model_construct(
+        metrics={
+            stage: StageMetricEntry.model_construct(
+                total=_construct_entry(entry["total"]),
+                children=StageMetrics.model_construct(
+                    metrics={
+                        name: _construct_entry(child)
+                        for name, child in entry["children"]["metrics"].items()
+                    }
+                ),
+            )
+            for stage, entry in message["metrics"].items()
+        }
+    )
 
 
 # TODO: figure out how to a type map here, as in we want to take a `message_name` and knowingly get the
 # appropriate output type
-def find_message_in_stream(stream: str, message_name: MessageName) -> Optional[Metrics]:
+def find_message_in_stream(
+    stream: str | bytes | Iterable[str] | Iterable[bytes], message_name: MessageName
+) -> Optional[Metrics]:
     """
     Scan the messages stream and find the message with the appropriate tag name.
+
+    The stream is consumed line by line, and scanning stops as soon as the message is
+    found. When reading the output of a running process, its pipe (e.g. `handle.stdout`)
+    should be passed directly. The whole output can also be passed, in which case its
+    lines are iterated over without splitting all of them up front.
     """
 
+    # Messages are tagged by their key, so the tag always appears as a quoted string
+    # regardless of how the JSON is formatted. Lines without it can be skipped without
+    # parsing them at all. The tag is kept as both `str` and `bytes`, so that it is
+    # matched to the type of each of the lines.
+    str_tag = f'"{message_name}"'
+    bytes_tag = str_tag.encode()
+
+    if isinstance(stream, str):
+        stream = io.StringIO(stream)
+    elif isinstance(stream, bytes):
+        stream = io.BytesIO(stream)
+
     # each line is a single message, so we can just iterate over them.
-    for line in stream.rstrip().split("\n"):
-        # Load the message as JSON, and extract the `message` item.
-        message = json.loads(line).get("message")
+    for line in stream:
+        if isinstance(line, bytes):
+            if bytes_tag not in line:
+                continue
+        elif str_tag not in line:
+            continue
 
-        # now we want to see if the line is a `TimingMetrics` message.
-        # if it is, we can parse it and return it.
+        # Load the message as JSON, and extract the `message` item. Lines that aren't
+        # JSON objects can't be messages, they're skipped without raising.
         try:
-            if message_name == "metrics":
-                return Metrics.model_validate(message)
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+
+        message = data.get("message") if isinstance(data, dict) else None
+
+        # now we want to see if the line is a `TimingMetrics` message, messages are
+        # tagged by their key. If it is, we can parse it and return it.
+        if not isinstance(message, dict) or message_name not in message:
+            continue
+
+        try:
+            if message_name == Metrics.MESSAGE_NAME:
+                if _STRICT:
+                    return _METRICS_ADAPTER.validate_python(message)
+
+                return _construct_metrics(message)
         except ValidationError as exc:
-            LOG.error(f"failed to parse the message: {"\n".join(exc.errors())}")
+            LOG.error(f"failed to parse the message: {exc}")
+            continue
+        except (KeyError, TypeError, AttributeError) as exc:
+            # The message has the right tag, but not the right shape.
+            LOG.error(f"failed to parse the message, malformed {exc!r}")
             continue
 
     return None
@@ -16,7 +16,7 @@ class CharacterSet(str, Enum):
     ascii = "ascii"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OutputSettings:
     """
     The settings for the output of the results. These settings options are
@@ -38,8 +38,20 @@ class OptimisationLevel(str, Enum):
         return self.value
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Settings:
     optimisation_level: OptimisationLevel
     output_kind: OutputKind
     repository: Path
+
+    """
+    The maximum number of compiler invocations that are run concurrently.
+    """
+    jobs: int = 1
+
+    """
+    Whether the measured iterations of a case are run concurrently. They are run one
+    after the other by default, since concurrent runs compete for the CPU and memory
+    bandwidth, which skews their timings and memory usage.
+    """
+    parallel_iterations: bool = False
@@ -1,81 +1,161 @@
 import math
-from typing import List, Tuple
+import sys
+import functools
+from typing import List, Optional, TextIO, Tuple
 
+import numpy as np
+from pydantic import TypeAdapter
 
 from .utils import CompilationProvider
-from .results import TestResults, percentage_diff
+from .results import ResultEntry, TestResults, percentage_diffs
 from .options import OutputSettings
 
 from rich.console import Console
 from rich.table import Table
+from rich.text import Span, Text
 
 
+# The formatters below are pure, and the tables repeat many of the same values, so the
+# formatted text is cached. Values are keyed by what is shown of them: the sign, which
+# picks the trend, and the value as it is displayed.
+#
+# `Text` is mutable, so the cache only holds the plain text and its styled spans, and a
+# new `Text` is built from them for every cell.
+type _RenderedText = Tuple[str, Tuple[Span, ...]]
+
+
+def _render(markup: str) -> _RenderedText:
+    text = Text.from_markup(markup)
+    return text.plain, tuple(text.spans)
+
+
+def _to_text(rendered: _RenderedText) -> Text:
+    plain, spans = rendered
+    return Text(plain, spans=list(spans))
+
+
+def _sign(value: float) -> int:
+    return (value > 0) - (value < 0)
+
+
+_SIZE_UNITS = ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi", "Yi")
+
+
+@functools.lru_cache(maxsize=4096)
 def sizeof_fmt(num: int, suffix="B") -> str:
     """
     Convert the given number of bytes into a human-readable format.
     """
 
-    for unit in ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"):
-        if abs(num) < 1024.0:
-            return f"{num:3.1f}{unit}{suffix}"
-        num /= 1024.0
-    return f"{num:.1f}Yi{suffix}"
+    # Each unit is 2^10 times the last, so the unit follows directly from the
+    # number of bits in the size.
+    exponent = min((int(abs(num)).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    exponent = max(exponent, 0)
+
+    return f"{num / (1 << (exponent * 10)):3.1f}{_SIZE_UNITS[exponent]}{suffix}"
+
 
+_TREND_MARKUP = {
+    0: ":up-down_arrow:",
+    1: "[red] :up_arrow: [/red]",
+    -1: "[green] :down_arrow: [/green]",
+}
 
-def get_trend_icon(value: float) -> str:
+# The markup of the cells, these are only formatted once per distinct value since the
+# formatted text is cached.
+_DOMAIN_ONE = "[{min_colour}bold]{min_value}% [/]"
+_DOMAIN_TWO = "[{min_colour}bold]{min_value}%[/], [{max_colour}bold]{max_value}%[/]"
+_AVG = "[bold]{trend} {value}%[/bold]"
+
+# The trend icons are rendered once, and every cell that shows a trend is built from them.
+_TREND_ICONS = {sign: _render(icon) for sign, icon in _TREND_MARKUP.items()}
+
+
+def get_trend_icon(value: float) -> Text:
     """
     Function to compute the trend icon based on the given value.
 
     If the value is 0, then we return an up-down arrow. If the value is
     positive, we return an up arrow, otherwise we return a down arrow.
     """
+    return _to_text(_TREND_ICONS[_sign(value)])
 
-    if value == 0:
-        return ":up-down_arrow:"
-    elif value > 0:
-        return "[red] :up_arrow: [/red]"
-    else:
-        return "[green] :down_arrow: [/green]"
 
-
-def get_trend_colour(value: float) -> str:
-    """
-    Function to compute the colour of the trend based on the given value.
-
-    If the value is 0, then we return an empty string. If the value is
-    positive, we return "red", otherwise we return "green".
-    """
-    if value == 0:
+def _trend_colour(sign: int) -> str:
+    if sign == 0:
         return ""
-    elif value > 0:
+    elif sign > 0:
         return "red "
     else:
         return "green "
 
 
-def compute_domain_text(domain: Tuple[float, float]) -> str:
+def _close(a: float, b: float) -> bool:
+    # Equal bounds are by far the most common, e.g. when there is a single case, so they
+    # skip the relative tolerance check altogether.
+    return a == b or math.isclose(a, b)
+
+
+@functools.lru_cache(maxsize=4096)
+def _domain_text(
+    close: bool, min_sign: int, min_value: str, max_sign: int, max_value: str
+) -> _RenderedText:
+    min_colour = _trend_colour(min_sign)
+
+    if close:
+        markup = _DOMAIN_ONE.format(min_colour=min_colour, min_value=min_value)
+    else:
+        markup = _DOMAIN_TWO.format(
+            min_colour=min_colour,
+            min_value=min_value,
+            max_colour=_trend_colour(max_sign),
+            max_value=max_value,
+        )
+
+    return _render(markup)
+
+
+def compute_domain_text(domain: Tuple[float, float]) -> Text:
     """
     Function to compute the textual representation of a given domain.
     """
 
-    if math.isclose(domain[0], domain[1]):
-        colour = get_trend_colour(domain[0])
-        return f"[{colour}bold]{domain[0]:.2f}% [/]"
-    else:
-        min_colour = get_trend_colour(domain[0])
-        max_colour = get_trend_colour(domain[1])
-        return f"[{min_colour}bold]{domain[0]:.2f}%[/], [{max_colour}bold]{domain[1]:.2f}%[/]"
+    return _to_text(
+        _domain_text(
+            _close(domain[0], domain[1]),
+            _sign(domain[0]),
+            f"{domain[0]:.2f}",
+            _sign(domain[1]),
+            f"{domain[1]:.2f}",
+        )
+    )
+
 
+@functools.lru_cache(maxsize=4096)
+def _avg_text(sign: int, value: str) -> _RenderedText:
+    return _render(_AVG.format(trend=_TREND_MARKUP[sign], value=value))
 
-def compute_avg_text(avg: float) -> str:
-    trend = get_trend_icon(avg)
-    return f"[bold]{trend} {abs(avg):.2f}%[/bold]"
+
+def compute_avg_text(avg: float) -> Text:
+    return _to_text(_avg_text(_sign(avg), f"{abs(avg):.2f}"))
+
+
+@functools.cache
+def _console() -> Console:
+    """
+    The console that results are printed to, it is created once and shared by all of
+    the outputs since creating it has to detect the capabilities of the terminal.
+    """
+    return Console(soft_wrap=True)
 
 
 class TabulatedOutput:
     """
     Simple class to house all of the logic to format and display
     details of the test results in a tabulated format.
+
+    The tables summarise all of the cases, so the results are collected as
+    they are appended, and are only printed once the run has finished.
     """
 
     settings: OutputSettings
@@ -87,15 +167,26 @@ class TabulatedOutput:
     def __init__(
         self,
         settings: OutputSettings,
-        results: TestResults,
         compilation_providers: List[CompilationProvider],
+        console: Optional[Console] = None,
     ):
         self.settings = settings
-        self.results = results
+        self.results = TestResults(case_results=[])
         self.compilation_providers = compilation_providers
-        self.console = Console(
-            soft_wrap=True,
-        )
+        self.console = console if console is not None else _console()
+
+    def append(self, entry: ResultEntry) -> None:
+        """
+        Add the result of a single case to the output.
+        """
+        self.results.append(entry)
+
+    def finish(self) -> None:
+        """
+        Print the collected results, this should be called once all of the cases
+        have been run.
+        """
+        self.print_info()
 
     def _construct_compiler_provider_comparison_string(
         self, background: str = "#F47983"
@@ -133,12 +224,14 @@ class TabulatedOutput:
         # We're comparing from the left (as the original) and the
         # right as the result.
 
-        for stage in self.results.stages:
-            rss_avg, rss_min, rss_max = self.results.get_rss_stats(stage)
-            d_avg, d_min, d_max = self.results.get_duration_stats(stage)
+        # All of the cells are built as `Text` up front, so that rich doesn't have to
+        # parse any markup when rendering the tables.
+        for stage, stats in self.results.stage_stats.items():
+            rss_avg, rss_min, rss_max = stats.rss
+            d_avg, d_min, d_max = stats.duration
 
             rss_time_comparison_table.add_row(
-                stage,
+                Text(stage),
                 compute_avg_text(rss_avg),
                 compute_domain_text((rss_min, rss_max)),
                 compute_avg_text(d_avg),
@@ -159,10 +252,22 @@ class TabulatedOutput:
         exe_size_comparison_table.add_column("Difference")
         exe_size_comparison_table.add_column("Value")
 
-        for case in self.results.case_results:
-            left_size = case.original.exe_size
-            right_size = case.result.exe_size
-
+        # The differences of all of the cases are computed at once, a size of `0` marks
+        # that it wasn't collected.
+        cases = self.results.case_results
+        left_sizes = np.array([c.original.exe_size or 0 for c in cases], dtype=np.int64)
+        right_sizes = np.array([c.result.exe_size or 0 for c in cases], dtype=np.int64)
+
+        diffs = right_sizes - left_sizes
+        diff_percentages = percentage_diffs(left_sizes, right_sizes)
+
+        for case, left_size, right_size, diff, diff_percentage in zip(
+            cases,
+            left_sizes.tolist(),
+            right_sizes.tolist(),
+            diffs.tolist(),
+            diff_percentages.tolist(),
+        ):
             # if both are none, we just skip it entirely.
             if not left_size and not right_size:
                 continue
@@ -171,21 +276,62 @@ class TabulatedOutput:
             # we write `N/A` for both
             if not left_size or not right_size:
                 exe_size_comparison_table.add_row(
-                    f"[bold]{case.name}[/bold]",
-                    "N/A",
-                    "N/A",
+                    Text.assemble((case.name, "bold")),
+                    Text("N/A"),
+                    Text("N/A"),
                 )
                 continue
 
-            diff = right_size - left_size
             trend = get_trend_icon(diff)
-            diff_percentage = percentage_diff(left_size, right_size)
 
             exe_size_comparison_table.add_row(
-                f"[bold]{case.name}[/bold]",
-                f"{trend} {sizeof_fmt(abs(diff))}",
-                f"{trend} {abs(diff_percentage):.2f}% ({sizeof_fmt(right_size)})",
+                Text.assemble((case.name, "bold")),
+                Text.assemble(trend, f" {sizeof_fmt(abs(diff))}"),
+                Text.assemble(
+                    trend, f" {abs(diff_percentage):.2f}% ({sizeof_fmt(right_size)})"
+                ),
             )
 
         self.console.print(rss_time_comparison_table, new_line_start=True)
         self.console.print(exe_size_comparison_table, new_line_start=True)
+
+
+# The results are plain dataclasses, so they are serialised through an adapter.
+_RESULT_ENTRY_ADAPTER = TypeAdapter(ResultEntry)
+
+
+class JsonOutput:
+    """
+    Output the test results as a JSON document of the form `{"results": [...]}`.
+
+    Each of the results is written out as soon as it is appended, so nothing is
+    kept in memory and the results of long runs can be consumed as they arrive.
+    """
+
+    stream: TextIO
+    count: int
+
+    def __init__(self, stream: TextIO = sys.stdout):
+        self.stream = stream
+        self.count = 0
+
+        self.stream.write('{"results":[')
+
+    def append(self, entry: ResultEntry) -> None:
+        """
+        Write the result of a single case to the output.
+        """
+        if self.count > 0:
+            self.stream.write(",")
+
+        self.stream.write(_RESULT_ENTRY_ADAPTER.dump_json(entry).decode())
+        self.stream.flush()
+        self.count += 1
+
+    def finish(self) -> None:
+        """
+        Close the JSON document, this should be called once all of the cases
+        have been run.
+        """
+        self.stream.write("]}\n")
+        self.stream.flush()
@@ -1,7 +1,8 @@
+import functools
 from dataclasses import dataclass
-from typing import Generator, List, Optional, Tuple, Literal
+from typing import Dict, Iterator, List, Optional, Tuple, Literal
 
-from pydantic import BaseModel
+import numpy as np
 
 from .cases import TestCaseResult
 from .messages import Metrics
@@ -20,6 +21,28 @@ def percentage_diff(left: float, right: float) -> float:
     return ((right - left) / left) * 100
 
 
+def percentage_diffs(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Element-wise version of `percentage_diff`.
+    """
+
+    diffs = np.full(np.shape(left), np.inf)
+    np.divide(right - left, left, out=diffs, where=left != 0)
+
+    return diffs * 100
+
+
+@dataclass
+class StageStats:
+    """
+    The percentage average, and the percentage range of the RSS and the
+    duration metrics of a stage.
+    """
+
+    rss: Tuple[float, float, float]
+    duration: Tuple[float, float, float]
+
+
 @dataclass
 class ResultEntryComparison:
     """
@@ -35,12 +58,13 @@ class ResultEntryComparison:
     exe_size: Optional[int]
 
 
-class ResultEntry(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ResultEntry:
     """
     A class that holds collected metrics about a test case being run under
     `original` and `result` test case configurations.
 
-    The actual results of the test case are stored in the `comparison` field.
+    The difference between the two results is computed on demand by `compare`.
     """
 
     name: str
@@ -59,14 +83,12 @@ class ResultEntry(BaseModel):
         if original.compile_metrics is None or result.compile_metrics is None:
             return None
 
-        compile_metrics = Metrics(
-            message="metrics",
+        result_metrics = result.compile_metrics.metrics
+        compile_metrics = Metrics.model_construct(
             metrics={
-                stage: original.compile_metrics.metrics[stage].diff(
-                    result.compile_metrics.metrics[stage]
-                )
-                for stage in original.compile_metrics.metrics
-            },
+                stage: entry.diff(result_metrics[stage])
+                for stage, entry in original.compile_metrics.metrics.items()
+            }
         )
 
         # just ignore the `exe_size` if we weren't able to collect it for
@@ -82,8 +104,13 @@ class ResultEntry(BaseModel):
 type MetricKind = Literal["time", "rss"]
 type ResultKind = Literal["left", "right"]
 
+# The order of the results and of the metrics in `TestResults.metric_values`.
+_RESULT_KINDS: Tuple[ResultKind, ...] = ("left", "right")
+_METRIC_KINDS: Tuple[MetricKind, ...] = ("rss", "time")
+
 
-class TestResults(BaseModel):
+@dataclass
+class TestResults:
     """
     The resultant collection of test results that were collected from the test cases.
 
@@ -92,56 +119,101 @@ class TestResults(BaseModel):
 
     case_results: List[ResultEntry]
 
-    def __iter__(self) -> Generator[ResultEntry, None, None]:
-        for result in self.case_results:
-            yield result
+    def __iter__(self) -> Iterator[ResultEntry]:
+        return iter(self.case_results)
 
     def append(self, item: ResultEntry) -> None:
         self.case_results.append(item)
 
-    @property
-    def stages(self) -> List[str]:
+        # Everything that is cached has to be computed again to include the new item.
+        self.__dict__.pop("_valid_results", None)
+        self.__dict__.pop("stages", None)
+        self.__dict__.pop("metric_values", None)
+        self.__dict__.pop("stage_stats", None)
+
+    @functools.cached_property
+    def _valid_results(self) -> List[ResultEntry]:
         """
-        Return the list of stages that are present in the test results.
+        The results for which the metrics of both of the runs were collected, the
+        metrics are only ever read from these. This is cached until another result is
+        appended.
+        """
+        return [
+            item
+            for item in self.case_results
+            if item.original.compile_metrics is not None
+            and item.result.compile_metrics is not None
+        ]
 
-        TODO: make this cached, since its only going to change if the `self.case_results`
-        changes.
+    @functools.cached_property
+    def stages(self) -> Tuple[str, ...]:
+        """
+        Return the stages that are present in the test results. This is cached until
+        another result is appended.
 
         TODO: make this include sub-stages too?
         """
         return (
-            self.case_results[0].original.compile_metrics.metrics.keys()
-            if self.case_results
-            else []
+            tuple(self._valid_results[0].original.compile_metrics.metrics.keys())
+            if self._valid_results
+            else ()
         )
 
+    @functools.cached_property
+    def metric_values(self) -> np.ndarray:
+        """
+        All of the metrics of the results, collected with a single pass over them into
+        a `(result, metric, stage, case)` array. The results and the metrics are
+        ordered as in `_RESULT_KINDS` and `_METRIC_KINDS`. Durations are in
+        milliseconds, and any missing RSS values are `nan`.
+
+        This is cached until another result is appended.
+        """
+        stages = self.stages
+        results = self._valid_results
+        shape = (2, len(stages), len(results))
+
+        # The durations are collected as they are stored, and are all converted at once.
+        rss = np.empty(shape)
+        secs = np.empty(shape, dtype=np.int64)
+        nanos = np.empty(shape, dtype=np.int64)
+
+        for case_idx, item in enumerate(results):
+            for side_idx, entry in enumerate((item.original, item.result)):
+                assert entry.compile_metrics is not None
+                metrics = entry.compile_metrics.metrics
+
+                for stage_idx, stage in enumerate(stages):
+                    total = metrics[stage].total
+                    idx = (side_idx, stage_idx, case_idx)
+
+                    rss[idx] = np.nan if total.end_rss is None else total.end_rss
+                    secs[idx] = total.duration.secs
+                    nanos[idx] = total.duration.nanos
+
+        durations = secs * 1e3 + nanos * 1e-6
+        values = np.stack((rss, durations), axis=1)
+
+        return values
+
     def get_metric(
         self, result: ResultKind, stage: str, metric: MetricKind
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
         Return a collection of all the associated metrics with a particular stage.
-        This will return a list of results for the specified stage.
+        This will return an array of results for the specified stage, which is a view
+        into `metric_values`.
 
         If the metric is `time`, `Duration`s are implicitly converted to milliseconds.
         """
         if stage not in self.stages:
             raise ValueError(f"Provided {stage=} is not a valid stage")
 
-        metrics = []
-
-        for item in self.case_results:
-            entry = item.original if result == "left" else item.result
-            assert entry.compile_metrics
-
-            entry = entry.compile_metrics.metrics[stage]
-
-            match metric:
-                case "rss":
-                    metrics.append(entry.total.end_rss)
-                case "time":
-                    metrics.append(entry.total.duration.to_ms())
-
-        return metrics
+        return self.metric_values[
+            _RESULT_KINDS.index(result),
+            _METRIC_KINDS.index(metric),
+            self.stages.index(stage),
+        ]
 
     def get_metric_domain(self, stage: str, metric: MetricKind) -> Tuple[float, float]:
         """
@@ -151,11 +223,8 @@ class TestResults(BaseModel):
         left_results = self.get_metric("left", stage, metric)
         right_results = self.get_metric("right", stage, metric)
 
-        diffs = [
-            percentage_diff(item[0], item[1])
-            for item in zip(left_results, right_results)
-        ]
-        return (min(diffs), max(diffs))
+        diffs = percentage_diffs(left_results, right_results)
+        return (float(diffs.min()), float(diffs.max()))
 
     def get_metric_avg(
         self, result: ResultKind, stage: str, metric: MetricKind
@@ -163,28 +232,49 @@ class TestResults(BaseModel):
         """
         Get the average of the specified metric for the specified stage.
         """
-        results = self.get_metric(result, stage, metric)
-        return sum(results) / len(results)
+        return float(self.get_metric(result, stage, metric).mean())
+
+    @functools.cached_property
+    def stage_stats(self) -> Dict[str, StageStats]:
+        """
+        Compute the statistics of all of the stages at once, all of the reductions are
+        done over `metric_values`.
+        """
+        stages = self.stages
+        if not stages:
+            return {}
+
+        values = self.metric_values
+
+        averages = values.mean(axis=3)
+        average_diffs = percentage_diffs(averages[0], averages[1])
+        diffs = percentage_diffs(values[0], values[1])
+        min_diffs, max_diffs = diffs.min(axis=2), diffs.max(axis=2)
+
+        return {
+            stage: StageStats(
+                *(
+                    (
+                        float(average_diffs[metric_idx, stage_idx]),
+                        float(min_diffs[metric_idx, stage_idx]),
+                        float(max_diffs[metric_idx, stage_idx]),
+                    )
+                    for metric_idx in range(2)
+                )
+            )
+            for stage_idx, stage in enumerate(stages)
+        }
 
     def get_rss_stats(self, stage: str) -> Tuple[float, float, float]:
         """
         Get the percentage average, and the percentage range of the RSS
         metric for the specified stage.
         """
+        return self.stage_stats[stage].rss
 
-        left_avg = self.get_metric_avg("left", stage, "rss")
-        right_avg = self.get_metric_avg("right", stage, "rss")
-        right_domain = self.get_metric_domain(stage, "rss")
-
-        return (percentage_diff(left_avg, right_avg), *right_domain)
-
-    def get_duration_stats(self, stage: str) -> Tuple[float, float]:
+    def get_duration_stats(self, stage: str) -> Tuple[float, float, float]:
         """
         Get the percentage average, and the percentage range of the duration
         metric for the specified stage.
         """
-        left_avg = self.get_metric_avg("left", stage, "time")
-        right_avg = self.get_metric_avg("right", stage, "time")
-        right_domain = self.get_metric_domain(stage, "time")
-
-        return (percentage_diff(left_avg, right_avg), *right_domain)
+        return self.stage_stats[stage].duration
@@ -1,41 +1,41 @@
-from typing import List
 import numpy as np
 
 OUTLIER_THRESHOLD = 1.4826 * 10.0
 EPSILON = np.finfo(float).eps
 
 
-def modified_zscores(data: List[float]) -> List[float]:
+def check_outliers_tensor(values: np.ndarray) -> np.ndarray:
     """
-    Compute the modified z-scores for the given data.
+    Check for outliers along the second axis of a `(stages, runs, columns)` tensor of
+    metrics, using their modified z-scores. A (unmodified) Z-score is defined by
+    `(x_i - x_mean)/x_stddev` whereas the modified Z-score is defined by
+    `(x_i - x_median)/MAD` where MAD is the median absolute deviation. Any `nan` values
+    are ignored.
 
-    Compute modified Z-scores for a given sample. A (unmodified) Z-score is defined by
-    `(x_i - x_mean)/x_stddev` whereas the modified Z-score is defined by `(x_i - x_median)/MAD`
-    where MAD is the median absolute deviation.
+    Returns a `(stages, columns)` mask of the stage columns that contain outliers.
 
     References:
     - <https://en.wikipedia.org/wiki/Median_absolute_deviation>
     """
-    assert len(data) > 0
 
-    median = np.median(data)
-    median_absolute_deviation = np.median([np.abs(x - median) for x in data])
-    median_absolute_deviation = (
-        median_absolute_deviation if median_absolute_deviation != 0 else EPSILON
-    )
+    # Columns without any values, such as the RSS of a compiler that doesn't report it,
+    # can't contain outliers. They are left out of the reductions, which would otherwise
+    # warn about every one of them.
+    present = ~np.all(np.isnan(values), axis=1)
+    outliers = np.zeros(present.shape, dtype=bool)
 
-    modified_z_scores = [
-        0.6745 * (x - median) / median_absolute_deviation for x in data
-    ]
-    return modified_z_scores
+    if not present.any():
+        return outliers
 
+    columns = values.transpose(0, 2, 1)[present]
 
-def check_outliers(
-    values: List[float],
-) -> bool:
-    """
-    Check whether any of the values are outliers.
-    """
+    median = np.nanmedian(columns, axis=1, keepdims=True)
+    deviations = np.abs(columns - median)
+
+    median_absolute_deviation = np.nanmedian(deviations, axis=1, keepdims=True)
+    median_absolute_deviation[median_absolute_deviation == 0] = EPSILON
+
+    modified_z_scores = 0.6745 * deviations / median_absolute_deviation
+    outliers[present] = np.any(modified_z_scores > OUTLIER_THRESHOLD, axis=1)
 
-    modified_z_scores = modified_zscores(values)
-    return any(np.abs(modified_z_scores) > OUTLIER_THRESHOLD)
+    return outliers
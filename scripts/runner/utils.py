@@ -1,51 +1,30 @@
 import os
+import re
 import shutil
+import hashlib
 import platform
-from subprocess import Popen, PIPE
+import functools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import DEVNULL, Popen
 from pathlib import Path
-from typing import List, Literal, Union, Optional
+from typing import Dict, List, Literal, Union, Optional
 
 from rich.text import Text
-from numpy import clip
 
+from .build import (
+    GitSession,
+    build_env,
+    find_cached_build,
+    prepare_worktree,
+    record_build,
+    resolve_revision,
+    worktree_lock,
+)
 from .options import TEMP_DIR, OptimisationLevel, Settings
 from .logger import LOG
 
 
-def checkout_git_revision(repo: Path, revision: str):
-    """
-    Checkout the given repository revision, assuming that the repository and
-    revision both exist.
-
-    :param repo: Path to the repository to checkout.
-    :param revision: The revision number.
-    :return: Nothing.
-    """
-    handle = Popen(["git", "checkout", revision], cwd=repo, stdout=PIPE, stderr=PIPE)
-
-    result = handle.wait()
-    if result != 0:
-        _, stderr = handle.communicate()
-
-        LOG.error(f"failed to checkout `{revision}`, error:\n{stderr}")
-        raise RuntimeError(f"Could not checkout {revision=}")
-
-
-def revision_exists(repo: Path, revision: str) -> bool:
-    """
-    Check if the given revision number exists for the given repository.
-
-    :param repo: The path to the repository.
-    :param revision: The revision identifier.
-    :return: True if exists, False otherwise.
-    """
-    result = Popen(
-        ["git", "cat-file", "-e", revision], cwd=repo, stdout=PIPE, stderr=PIPE
-    ).wait()
-
-    return result == 0
-
-
 type EntryKind = Literal["file", "revision"]
 
 
@@ -70,8 +49,33 @@ class Entry:
         self.name = name
 
 
+# A revision that contains a path separator has to be a reference such as `origin/main`,
+# references can't have empty components nor components that begin with `.`. Any of the
+# revision suffixes like `~1`, `^{commit}` or `@{upstream}` may follow them.
+_REFERENCE_RE = re.compile(r"[\w~^@{}:+-][\w.~^@{}:+-]*(/[\w~^@{}:+-][\w.~^@{}:+-]*)+")
+
+
+def _may_be_revision(item: str) -> bool:
+    """
+    Check whether the given item could name a revision at all, this doesn't
+    check whether the revision exists.
+    """
+
+    if not item:
+        return False
+
+    # Revisions starting with `:` name objects by a path, or by a commit message.
+    if item.startswith(":"):
+        return True
+
+    if "/" not in item and os.sep not in item:
+        return True
+
+    return _REFERENCE_RE.fullmatch(item) is not None
+
+
 def to_entry(
-    settings: Settings, name: str, path_or_revision: Union[Path, str]
+    settings: Settings, git: GitSession, name: str, path_or_revision: Union[Path, str]
 ) -> Optional[Entry]:
     """
     Computer whether the given item is a path to an executable or a revision
@@ -81,9 +85,11 @@ def to_entry(
     to an executable.
 
     - If the path does not point to an executable, attempt to check whether this
-    is a revision.
+    is a revision. Anything that is clearly a path is never looked up.
 
-    :param repo: The path to the repository.
+    :param settings: The settings of the run.
+    :param git: The session to check for revisions of the repository with.
+    :param name: The name of the entry.
     :param path_or_revision: The item to check.
     :return: An entry object if either the item is a file or a revision, else nothing.
     """
@@ -93,7 +99,7 @@ def to_entry(
     if path.is_file() and os.access(path, os.X_OK):
         return Entry(kind="file", data=str(path), name=name)
 
-    if revision_exists(settings.repository, str(path)):
+    if _may_be_revision(str(path_or_revision)) and git.revision_exists(str(path)):
         return Entry(kind="revision", data=str(path), name=name)
 
     return None
@@ -107,16 +113,35 @@ class CompilationProvider:
         self.entry = entry
         self.path = path
 
-    def __str__(self) -> str:
+    @functools.cached_property
+    def digest(self) -> bytes:
+        """
+        The digest of the compiler executable, two providers with the same digest are
+        the same compiler regardless of where they came from.
+        """
+        with open(self.path, "rb") as f:
+            return hashlib.file_digest(f, "blake2b").digest()
+
+    @functools.cached_property
+    def _rendered(self) -> str:
+        """
+        The name of the provider as it is printed, this only depends on the entry so
+        it is only rendered once.
+        """
         item = Text.assemble(f"{self.entry.data}", overflow="ellipsis", end="")
 
-        width = clip(0, 20, len(self.entry.data))
+        width = min(len(self.entry.data), 20)
         item.align("center", width=width)
 
         return item.__str__()
 
+    def __str__(self) -> str:
+        return self._rendered
+
 
-def compile_and_copy(settings: Settings, entry: Entry) -> Optional[CompilationProvider]:
+def compile_and_copy(
+    settings: Settings, entry: Entry, commit: Optional[str] = None
+) -> Optional[CompilationProvider]:
     """
     Attempts to extract an executable from the given repository and
     with the given entry configuration. The configuration can either be
@@ -127,6 +152,10 @@ def compile_and_copy(settings: Settings, entry: Entry) -> Optional[CompilationPr
 
     * If it is a path, the function will simply copy over the file into
     the directory.
+
+    The executable is hard linked rather than copied when that is possible. The
+    `commit` that a revision resolves to can be passed in when it is already known,
+    otherwise it is resolved here.
     """
     if not TEMP_DIR.exists():
         TEMP_DIR.mkdir()
@@ -137,47 +166,137 @@ def compile_and_copy(settings: Settings, entry: Entry) -> Optional[CompilationPr
 
     match entry.kind:
         case "file":
-            try:
-                shutil.copyfile(entry.data, dst)
-            except shutil.SameFileError:
-                # we don't care if it's the same file
-                pass
-
+            _copy_executable(Path(entry.data), dst)
             LOG.info(f"copied `{entry.data}`")
         case "revision":
-            # we need to checkout the revision of the repository, compile it, and
-            # then copy the file over.
-            checkout_git_revision(repo, entry.data)
-            LOG.info(f"checked out `{entry.data}`")
-
-            cargo_args = compute_cargo_args(settings)
-            handle = Popen(
-                ["cargo", "build", *cargo_args], cwd=repo, stderr=PIPE, stdout=PIPE
-            )
-            LOG.info(
-                f"compiling revision `{entry.data}` in `{settings.optimisation_level}` mode"
-            )
+            # we need to prepare a worktree of the revision, compile it, and
+            # then copy the file over. If the revision was already built with
+            # the same profile, the previous build is re-used. The worktree is
+            # locked throughout, since other entries may be of the same commit.
+            if commit is None:
+                commit = resolve_revision(repo, entry.data)
 
-            result = handle.wait()
-            if result != 0:
-                _, stderr = handle.communicate()
-                raise RuntimeError(
-                    f"Compilation returned a non-zero exit code, output:\n{stderr.decode()}"
-                )
+            profile = str(settings.optimisation_level)
 
-            exe_name = "hashc.exe" if platform.system() == "Windows" else "hashc"
-            exe_path = repo / "target" / "release" / exe_name
+            with worktree_lock(commit):
+                worktree = prepare_worktree(repo, commit)
+                exe_path = find_cached_build(worktree, profile)
 
-            if not exe_path.exists() and os.access(exe_path, os.X_OK):
-                raise FileNotFoundError(
-                    f"No executable was produced for `{entry.name}`"
-                )
+                if exe_path is None:
+                    exe_path = _build_revision(settings, entry, worktree)
+                    record_build(worktree, profile, exe_path)
+                else:
+                    LOG.info(f"re-using the existing build of revision `{entry.data}`")
 
-            shutil.copyfile(exe_path, dst)
+                _copy_executable(exe_path, dst)
 
     return CompilationProvider(path=dst, entry=entry)
 
 
+def _copy_executable(src: Path, dst: Path):
+    """
+    Place the compiler executable at `src` at `dst`. When both are on the same file
+    system, `dst` is made a hard link of `src` so that nothing has to be copied,
+    otherwise the file is copied over.
+    """
+
+    # we don't care if it's the same file
+    if dst.exists() and os.path.samefile(src, dst):
+        return
+
+    # any previous executable is removed rather than overwritten, since it may be
+    # a link to the build of another revision.
+    dst.unlink(missing_ok=True)
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+        # Ensure that the compiler itself is executable, this is done once here rather
+        # than on every run of a test case. A link already is, since `src` had to be.
+        os.chmod(dst, 0o755)
+
+
+def compile_all(
+    settings: Settings, entries: List[Entry]
+) -> List[Optional[CompilationProvider]]:
+    """
+    Run `compile_and_copy` over all of the given entries, and return the providers in
+    the same order. The revisions are grouped by the commit that they resolve to, each
+    commit is built once in its own worktree, and the different commits are built
+    concurrently. The files are only copied, so they skip the pool.
+    """
+    results: List[Optional[CompilationProvider]] = [None] * len(entries)
+    commits: Dict[str, List[int]] = {}
+
+    for idx, entry in enumerate(entries):
+        if entry.kind == "revision":
+            commit = resolve_revision(settings.repository, entry.data)
+            commits.setdefault(commit, []).append(idx)
+
+    def build(commit: str, indices: List[int]):
+        # The entries after the first re-use its build, since they are of the same commit.
+        for idx in indices:
+            results[idx] = compile_and_copy(settings, entries[idx], commit)
+
+    # The builds are `cargo` processes, so threads are enough to run them side by side.
+    with ThreadPoolExecutor(max_workers=max(1, len(commits))) as executor:
+        builds = [
+            executor.submit(build, commit, indices)
+            for commit, indices in commits.items()
+        ]
+
+        for idx, entry in enumerate(entries):
+            if entry.kind == "file":
+                results[idx] = compile_and_copy(settings, entry)
+
+        for future in builds:
+            future.result()
+
+    return results
+
+
+def _build_revision(settings: Settings, entry: Entry, worktree: Path) -> Path:
+    """
+    Compile the compiler within the worktree of the given revision entry, and
+    return the path to the produced executable.
+    """
+
+    cargo_args = compute_cargo_args(settings)
+
+    # `cargo` writes its progress to stderr, which can be a lot for a full build. It is
+    # kept in a temporary file rather than a pipe, so it can never fill up the pipe and
+    # stall the build, and is only read back if the build fails.
+    with tempfile.TemporaryFile() as stderr:
+        handle = Popen(
+            ["cargo", "build", *cargo_args],
+            cwd=worktree,
+            env=build_env(settings.repository),
+            stderr=stderr,
+            stdout=DEVNULL,
+        )
+        LOG.info(
+            f"compiling revision `{entry.data}` in `{settings.optimisation_level}` mode"
+        )
+
+        result = handle.wait()
+        if result != 0:
+            stderr.seek(0)
+            raise RuntimeError(
+                "Compilation returned a non-zero exit code, output:\n"
+                f"{stderr.read().decode(errors='replace')}"
+            )
+
+    exe_name = "hashc.exe" if platform.system() == "Windows" else "hashc"
+    exe_path = worktree / "target" / str(settings.optimisation_level) / exe_name
+
+    if not exe_path.exists() or not os.access(exe_path, os.X_OK):
+        raise FileNotFoundError(f"No executable was produced for `{entry.name}`")
+
+    return exe_path
+
+
 def compute_cargo_args(settings: Settings) -> List[str]:
     """
     Compute the arguments that we should pass to `cargo` when